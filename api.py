@@ -1,18 +1,135 @@
+import asyncio
 import json
 import tempfile
 import shutil
+import time
+from contextlib import asynccontextmanager
 from os import getenv
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
 from backend import Backend, BackendType
+from dedup import DuplicateIndex, image_signature, DEFAULT_MAX_BLOCK_DIFF, DEFAULT_MAX_DISTANCE
+from regions import RegionCache, DEFAULT_LAYOUT_DISTANCE
+from traffic import TrafficRecorder, file_sha256
+from usage import UsageTracker
+from workers import create_image_pool
 
 load_dotenv()
 
-app = FastAPI(title="Invoice Scanner API")
 FRONTEND_PATH = Path(__file__).parent / "frontend"
+WARMUP_IMAGE = Path(__file__).parent / "test_invoice.png"
+usage_tracker = UsageTracker(keep_calls=True)
+
+dedup_index = None
+traffic_recorder = None
+
+
+def open_dedup_index():
+    """Open the near-duplicate index configured through DEDUP_INDEX_PATH, if any."""
+    if not getenv("DEDUP_INDEX_PATH"):
+        return None
+    return DuplicateIndex(
+        getenv("DEDUP_INDEX_PATH"),
+        max_distance=int(getenv("DEDUP_MAX_DISTANCE", DEFAULT_MAX_DISTANCE)),
+        max_block_diff=int(getenv("DEDUP_MAX_BLOCK_DIFF", DEFAULT_MAX_BLOCK_DIFF))
+    )
+
+
+def open_traffic_recorder():
+    """Open the traffic log configured through TRAFFIC_LOG_PATH, if any."""
+    if not getenv("TRAFFIC_LOG_PATH"):
+        return None
+    redact = getenv("TRAFFIC_REDACT", "").lower() in ("1", "true", "yes")
+    return TrafficRecorder(getenv("TRAFFIC_LOG_PATH"), redact=redact)
+
+
+def create_backend(image_pool=None):
+    """Create the backend configured through the environment."""
+    backend_url = getenv("LLAMA_SERVER_URL", "http://localhost:8080/v1")
+    region_cache = None
+    if getenv("ROI_CROPPING", "").lower() in ("1", "true", "yes"):
+        region_cache = RegionCache(int(getenv("LAYOUT_MAX_DISTANCE", DEFAULT_LAYOUT_DISTANCE)))
+    return Backend(type=BackendType.LLAMA, base_url=backend_url, usage=usage_tracker,
+                   image_pool=image_pool, region_cache=region_cache)
+
+
+def check_backend(backend):
+    """Probe backend reachability and round-trip latency."""
+    try:
+        latency = backend.ping(timeout=float(getenv("READY_TIMEOUT", "2")))
+    except Exception as e:
+        return {"reachable": False, "error": str(e)}
+    return {"reachable": True, "latency_ms": round(latency * 1000, 1)}
+
+
+def warm_up(backend):
+    """Run one inference on the bundled test invoice so the model is primed."""
+    try:
+        backend.process_invoice(str(WARMUP_IMAGE))
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    finally:
+        usage_tracker.pop_image(str(WARMUP_IMAGE))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Pre-connect to the backend and optionally warm it up before serving.
+
+    The backend and image pool created here are shared by all requests.
+    Set WARMUP_INFERENCE=1 to also run a full inference on test_invoice.png
+    during startup. Heavy state is opened here rather than at import time,
+    since image pool workers re-import this module.
+    """
+    global dedup_index, traffic_recorder
+    if dedup_index is None:
+        dedup_index = open_dedup_index()
+    if traffic_recorder is None:
+        traffic_recorder = open_traffic_recorder()
+    app.state.ready = False
+    app.state.image_pool = create_image_pool()
+    app.state.backend = create_backend(app.state.image_pool)
+    status = await run_in_threadpool(check_backend, app.state.backend)
+    if not status["reachable"]:
+        print(f"Backend not reachable at startup: {status['error']}")
+    elif getenv("WARMUP_INFERENCE", "").lower() in ("1", "true", "yes"):
+        await run_in_threadpool(warm_up, app.state.backend)
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    app.state.backend = None
+    if app.state.image_pool is not None:
+        app.state.image_pool.shutdown(cancel_futures=True)
+    app.state.image_pool = None
+
+
+app = FastAPI(title="Invoice Scanner API", lifespan=lifespan)
+
+
+async def run_cpu(func, *args):
+    """Run CPU-bound image work in the image pool, or a worker thread without one."""
+    pool = getattr(app.state, "image_pool", None)
+    if pool is None:
+        return await run_in_threadpool(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+def elapsed_ms(start):
+    """Milliseconds since a time.perf_counter() reading."""
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def duplicate_signature(image_path):
+    """Return the duplicate-detection signature of an image, or None if it cannot be decoded."""
+    try:
+        return await run_cpu(image_signature, image_path)
+    except OSError:
+        return None
 
 
 @app.post("/process")
@@ -21,24 +138,89 @@ async def process_invoice(file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
+    start = time.perf_counter()
+    entry = {"ts": time.time(), "filename": file.filename, "content_type": file.content_type}
+    stages = {}
+
     with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
         shutil.copyfileobj(file.file, tmp)
         tmp_path = tmp.name
+        entry["image_bytes"] = tmp.tell()
+    stages["upload_ms"] = elapsed_ms(start)
 
     try:
-        backend_url = getenv("LLAMA_SERVER_URL", "http://localhost:8080/v1")
-        backend = Backend(type=BackendType.LLAMA, base_url=backend_url)
-        result = backend.process_invoice(tmp_path)
+        signature = None
+        if dedup_index is not None:
+            stage_start = time.perf_counter()
+            signature = await duplicate_signature(tmp_path)
+            stages["hash_ms"] = elapsed_ms(stage_start)
+        match = await run_in_threadpool(dedup_index.lookup, *signature) if signature is not None else None
+
+        if match is not None:
+            result, distance = match
+        else:
+            backend = getattr(app.state, "backend", None) or create_backend()
+            stage_start = time.perf_counter()
+            result = await run_in_threadpool(backend.process_invoice, tmp_path)
+            stages["inference_ms"] = elapsed_ms(stage_start)
+            # None also covers unparseable detection replies, which must not stick
+            if signature is not None and result is not None:
+                await run_in_threadpool(dedup_index.add, *signature, result)
 
         if result is None:
-            return {"error": "No invoice detected in image"}
-
-        data = json.loads(result)
+            data = {"error": "No invoice detected in image"}
+        else:
+            data = json.loads(result)
+        outcome = "invoice" if result is not None else "not_invoice"
+        entry.update(status=200, outcome=outcome, result=dict(data))
+
+        if match is not None:
+            data["probable_duplicate"] = True
+            data["duplicate_distance"] = distance
+            entry["outcome"] = "duplicate"
+        else:
+            data["usage"] = usage_tracker.pop_image(tmp_path)
         return data
     except Exception as e:
+        entry.update(status=500, outcome="error")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        Path(tmp_path).unlink(missing_ok=True)
+        usage_tracker.pop_image(tmp_path)
+        calls = usage_tracker.pop_calls(tmp_path)
+        try:
+            if traffic_recorder is not None:
+                entry.update(total_ms=elapsed_ms(start), stages=stages, calls=calls)
+                entry["image_sha256"] = await run_cpu(file_sha256, tmp_path)
+                traffic_recorder.record(entry)
+        except Exception as e:
+            print(f"Traffic recording failed: {e}")
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+
+@app.get("/usage")
+async def usage_summary():
+    """Report token and cost usage since server start, per backend/model."""
+    return usage_tracker.summary()
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: startup has finished and the backend is reachable."""
+    backend = getattr(app.state, "backend", None)
+    if not getattr(app.state, "ready", False) or backend is None:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+
+    status = await run_in_threadpool(check_backend, backend)
+    if not status["reachable"]:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "backend": status})
+    return {"status": "ready", "backend": status}
 
 
 @app.get("/")
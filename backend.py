@@ -3,6 +3,7 @@ from openai import OpenAI
 from os import getenv
 from dotenv import load_dotenv
 from base import BaseInferencer
+from usage import UsageTracker
 
 load_dotenv()
 
@@ -26,11 +27,17 @@ class Backend(BaseInferencer):
         model: Model identifier for OpenRouter/Ollama backends
         base_url: Custom server URL (defaults to LLAMA_SERVER_URL env var for LLAMA backend)
         api_key: Custom API key (defaults to environment variables)
+        usage: UsageTracker to record token and cost usage in (optional)
+        image_pool: Executor for CPU-bound image work (see workers.create_image_pool)
+        region_cache: RegionCache to enable region-of-interest extraction (optional)
 
     Attributes:
         type: The selected backend type
         model: The model identifier (if applicable)
         client: OpenAI-compatible client instance
+        usage: UsageTracker recording token and cost usage, or None
+        image_pool: Executor for CPU-bound image work, or None to work inline
+        region_cache: Layout cache for region crops, or None to send full pages
     """
 
     def __init__(
@@ -38,10 +45,16 @@ class Backend(BaseInferencer):
         type: BackendType,
         model: str = None,
         base_url: str = None,
-        api_key: str = None
+        api_key: str = None,
+        usage: UsageTracker = None,
+        image_pool=None,
+        region_cache=None
     ):
         self.type = type
         self.model = model
+        self.usage = usage
+        self.image_pool = image_pool
+        self.region_cache = region_cache
 
         if type == BackendType.LLAMA:
             self.client = OpenAI(
@@ -59,7 +72,17 @@ class Backend(BaseInferencer):
                 api_key=getenv("OPENROUTER_API_KEY")
             )
 
-    def generate(self, prompt, image_path, response_format, model=None):
+    def usage_key(self, model=None):
+        """Attribute usage to "backend/model"."""
+        return f"{self.type.value}/{model or self.model or 'default'}"
+
+    def request_options(self):
+        """Ask OpenRouter to report the cost of each call in its usage block."""
+        if self.type == BackendType.OPENROUTER:
+            return {"extra_body": {"usage": {"include": True}}}
+        return {}
+
+    def generate(self, prompt, image_path, response_format, model=None, images=None):
         """
         Generate completion with model-aware handling.
 
@@ -71,6 +94,7 @@ class Backend(BaseInferencer):
             image_path: Path to image file
             response_format: OpenAI response format specification
             model: Override model identifier (optional)
+            images: Base64 images to send instead of image_path (optional)
 
         Returns:
             str: Model response content
@@ -78,4 +102,4 @@ class Backend(BaseInferencer):
         effective_model = model or self.model
         if self.type == BackendType.LLAMA:
             effective_model = ""
-        return super().generate(prompt, image_path, response_format, effective_model)
+        return super().generate(prompt, image_path, response_format, effective_model, images)
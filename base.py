@@ -1,11 +1,18 @@
 import json
-from typing import Optional
+import time
+from typing import List, Optional
+from dedup import dhash
+from regions import crop_regions, parse_regions
 from utils import (
     encode_image,
+    INVOICE_CROPS_NOTE,
     INVOICE_DETECTION_PROMPT,
+    INVOICE_PROPERTIES_SCHEMA,
     INVOICE_PROPERTIES_PROMPT,
+    INVOICE_REGIONS_PROMPT,
     invoice_detection_response_format,
-    invoice_properties_response_format
+    invoice_properties_response_format,
+    invoice_regions_response_format
 )
 
 
@@ -18,37 +25,142 @@ class BaseInferencer:
 
     Attributes:
         client: OpenAI-compatible client for LLM calls
+        usage: UsageTracker receiving token/cost usage of every call (optional)
+        image_pool: Executor for hashing and cropping (optional, inline if None)
+        region_cache: RegionCache enabling region-of-interest extraction (optional)
     """
 
-    def generate(self, prompt: str, image_path: str, response_format: dict, model: Optional[str] = None) -> str:
+    usage = None
+    image_pool = None
+    region_cache = None
+    _prefetched = None
+
+    def run_image_task(self, func, *args):
+        """
+        Run CPU-bound image work in the image pool, or inline without one.
+
+        Work started earlier by prefetch_regions() is picked up instead of
+        being submitted again.
+        """
+        future = self._prefetched.pop(_task_key(func, args), None) if self._prefetched else None
+        if future is not None:
+            return future.result()
+        if self.image_pool is not None:
+            return self.image_pool.submit(func, *args).result()
+        return func(*args)
+
+    def prefetch_regions(self, image_path: str) -> None:
+        """
+        Start the region work of an upcoming image in the image pool.
+
+        Meant for batch loops that call it for the next few images while the
+        current one waits on the model. The first call submits the layout
+        hash; a later call, once the hash is known and its layout is cached,
+        submits the crops as well. Does nothing without a pool or region cache.
+
+        Args:
+            image_path: Path to an image that will be processed soon
+        """
+        if self.image_pool is None or self.region_cache is None:
+            return
+        if self._prefetched is None:
+            self._prefetched = {}
+
+        hash_key = _task_key(dhash, (image_path,))
+        hash_future = self._prefetched.get(hash_key)
+        if hash_future is None:
+            self._prefetched[hash_key] = self.image_pool.submit(dhash, image_path)
+            return
+        if not hash_future.done() or hash_future.exception() is not None:
+            return
+
+        boxes = self.region_cache.lookup(hash_future.result())
+        crop_key = _task_key(crop_regions, (image_path, boxes))
+        if boxes and crop_key not in self._prefetched:
+            self._prefetched[crop_key] = self.image_pool.submit(crop_regions, image_path, boxes)
+
+    def release_prefetched(self, image_path: str) -> None:
+        """
+        Drop prefetched work of an image that will not use it (anymore).
+
+        Args:
+            image_path: Path to the processed image
+        """
+        for key in [key for key in self._prefetched or {} if key[1] == image_path]:
+            self._prefetched.pop(key).cancel()
+
+    def usage_key(self, model: Optional[str] = None) -> str:
+        """Return the label that usage of a call is attributed to."""
+        return model or "default"
+
+    def request_options(self) -> dict:
+        """Return extra keyword arguments for the completion request."""
+        return {}
+
+    def ping(self, timeout: float = 5.0) -> float:
+        """
+        Check that the inference server is reachable.
+
+        Lists the server's models, which also opens the client's HTTP connection
+        so the first real request does not pay for connection setup.
+
+        Args:
+            timeout: Request timeout in seconds
+
+        Returns:
+            float: Round-trip latency in seconds
+
+        Raises:
+            openai.APIError: If the server cannot be reached
+        """
+        start = time.perf_counter()
+        self.client.with_options(timeout=timeout, max_retries=0).models.list()
+        return time.perf_counter() - start
+
+    def generate(
+        self,
+        prompt: str,
+        image_path: str,
+        response_format: dict,
+        model: Optional[str] = None,
+        images: Optional[List[str]] = None
+    ) -> str:
         """
         Generate completion via LLM with image support.
 
         Encodes the image to base64 and sends a multimodal request
         to the LLM with the specified response format for structured output.
+        Token and cost usage of the call is recorded in `usage` if set.
 
         Args:
             prompt: Text prompt for the model
             image_path: Path to image file
             response_format: OpenAI response format specification
             model: Model identifier (optional, defaults to empty string)
+            images: Base64 images to send instead of image_path (optional)
 
         Returns:
             str: Model response content as JSON string
         """
-        image = encode_image(image_path)
+        if images is None:
+            images = [encode_image(image_path)]
+        start = time.perf_counter()
         completion = self.client.chat.completions.create(
             model=model or "",
             messages=[{
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
+                "content": [{"type": "text", "text": prompt}] + [
                     {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}}
+                    for image in images
                 ]
             }],
             response_format=response_format,
-            temperature=0
+            temperature=0,
+            **self.request_options()
         )
+        if self.usage is not None:
+            self.usage.record(self.usage_key(model), image_path, completion.usage,
+                              time.perf_counter() - start)
         return completion.choices[0].message.content
 
     def invoice_or_not(self, image_path: str, model: Optional[str] = None) -> str:
@@ -72,12 +184,64 @@ class BaseInferencer:
             model
         )
 
+    def invoice_regions(self, image_path: str, model: Optional[str] = None) -> str:
+        """
+        Locate the date and totals regions of an invoice image.
+
+        Args:
+            image_path: Path to the invoice image
+            model: Model identifier (optional)
+
+        Returns:
+            str: JSON string with {"regions": [{x0, y0, x1, y1}, ...]}
+        """
+        return self.generate(
+            INVOICE_REGIONS_PROMPT,
+            image_path,
+            invoice_regions_response_format(),
+            model
+        )
+
+    def layout_hash(self, image_path: str) -> Optional[int]:
+        """Return the layout hash of an image, or None if it cannot be decoded locally."""
+        try:
+            return self.run_image_task(dhash, image_path)
+        except OSError:
+            return None
+
+    def region_crops(self, image_path: str, layout_hash: int, model: Optional[str] = None) -> List[str]:
+        """
+        Crop the date and totals regions of an invoice image.
+
+        Boxes are taken from `region_cache` when a page with the same layout
+        was seen before, otherwise located by the model and cached; a layout
+        without regions is cached as well, so its pages skip the locating call.
+
+        Args:
+            image_path: Path to the invoice image
+            layout_hash: Layout hash of the image (see layout_hash)
+            model: Model identifier (optional)
+
+        Returns:
+            list: Base64 encoded crops, empty if the layout has no regions
+        """
+        boxes = self.region_cache.lookup(layout_hash)
+        if boxes is None:
+            boxes = parse_regions(self.invoice_regions(image_path, model))
+            self.region_cache.add(layout_hash, boxes)
+        if not boxes:
+            return []
+        return self.run_image_task(crop_regions, image_path, boxes)
+
     def invoice_properties(self, image_path: str, model: Optional[str] = None) -> str:
         """
         Extract structured data from an invoice image.
 
         Performs OCR and information extraction to get invoice date,
-        total amount, and currency.
+        total amount, and currency. With a `region_cache` set, only crops
+        of the date and totals regions are sent; the full page is used if
+        no regions are found, and fills any field the crops left empty.
+        A layout whose crops leave fields empty is sent in full from then on.
 
         Args:
             image_path: Path to the invoice image
@@ -86,12 +250,38 @@ class BaseInferencer:
         Returns:
             str: JSON string with invoice_date, total_amount, and currency
         """
-        return self.generate(
+        crop_values = {}
+        layout_hash = self.layout_hash(image_path) if self.region_cache is not None else None
+        if layout_hash is not None:
+            crops = self.region_crops(image_path, layout_hash, model)
+            if crops:
+                result = self.generate(
+                    INVOICE_CROPS_NOTE + INVOICE_PROPERTIES_PROMPT,
+                    image_path,
+                    invoice_properties_response_format(),
+                    model,
+                    images=crops
+                )
+                crop_values = _json_object(result)
+                if all(crop_values.get(field) is not None for field in INVOICE_PROPERTIES_SCHEMA["required"]):
+                    return result
+                # The cached boxes miss fields on this layout; stop paying for crops plus the full page
+                self.region_cache.remove(layout_hash)
+                self.region_cache.add(layout_hash, [])
+
+        result = self.generate(
             INVOICE_PROPERTIES_PROMPT,
             image_path,
             invoice_properties_response_format(),
             model
         )
+        values = _json_object(result)
+        if not crop_values or not values:
+            return result
+
+        # Keep what the crops did read and fill only the missing fields from the page
+        values.update({field: value for field, value in crop_values.items() if value is not None})
+        return json.dumps(values)
 
     def process_invoice(self, image_path: str, model: Optional[str] = None) -> Optional[str]:
         """
@@ -121,3 +311,19 @@ class BaseInferencer:
         else:
             print("Image is not an invoice.")
             return None
+
+
+def _task_key(func, args: tuple) -> tuple:
+    """Hashable key of an image task; box lists become tuples."""
+    def freeze(value):
+        return tuple(freeze(item) for item in value) if isinstance(value, list) else value
+    return (func,) + freeze(list(args))
+
+
+def _json_object(response: str) -> dict:
+    """Parse a model response as a JSON object, returning {} if it is not one."""
+    try:
+        value = json.loads(response)
+    except json.JSONDecodeError:
+        return {}
+    return value if isinstance(value, dict) else {}
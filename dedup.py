@@ -0,0 +1,301 @@
+import sqlite3
+import threading
+from typing import Any, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+DHASH_SIZE = 8
+DEDUP_HASH_SIZE = 16
+DEFAULT_MAX_DISTANCE = 10
+THUMBNAIL_SIZE = 64
+DEFAULT_MAX_BLOCK_DIFF = 48
+MIN_CHUNKS = 5
+
+
+def dhash(image_path: str, hash_size: int = DHASH_SIZE) -> int:
+    """
+    Compute the difference hash (dHash) of an image.
+
+    The image is converted to grayscale and shrunk to (hash_size + 1) x hash_size
+    pixels; each bit records whether a pixel is brighter than its right neighbour.
+    Re-scans and re-photographs of the same page land within a few bits of each other.
+
+    Args:
+        image_path: Path to the image file
+        hash_size: Edge length of the hash grid (default 8 -> 64-bit hash)
+
+    Returns:
+        int: The perceptual hash as an unsigned integer
+    """
+    with Image.open(image_path) as image:
+        return _dhash(image.convert("L"), hash_size)
+
+
+def image_signature(image_path: str) -> Tuple[int, bytes]:
+    """
+    Compute the duplicate-detection signature of an image.
+
+    Whole-page hashes cannot tell two invoices on the same template apart, so
+    a hash match is confirmed against a 64x64 block thumbnail: editing the date
+    or totals block changes a few cells strongly, while a re-scan changes all
+    of them slightly.
+
+    Args:
+        image_path: Path to the image file
+
+    Returns:
+        tuple: (16x16 dHash, contrast-normalized grayscale thumbnail bytes)
+    """
+    with Image.open(image_path) as image:
+        gray = image.convert("L")
+        thumbnail = ImageOps.autocontrast(gray).resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX)
+        return _dhash(gray, DEDUP_HASH_SIZE), thumbnail.tobytes()
+
+
+def block_difference(a: bytes, b: bytes) -> int:
+    """Return the largest per-cell difference between two thumbnails."""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def _dhash(gray: Image.Image, hash_size: int) -> int:
+    """Compute the dHash of a grayscale image."""
+    pixels = gray.resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    """Return the number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes using Hamming distance.
+
+    Radius queries only descend into children whose edge distance lies within
+    [d - radius, d + radius]. Pruning is effective for short hashes and
+    small radii such as the 64-bit layout hashes of RegionCache; the 256-bit
+    duplicate index uses multi-index hashing instead (see DuplicateIndex).
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, payload: Any = None) -> None:
+        """
+        Insert a hash with an associated payload.
+
+        Args:
+            value: Hash to insert
+            payload: Arbitrary data returned by search()
+        """
+        node = [value, payload, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int, Any]]:
+        """
+        Find all entries within a Hamming radius.
+
+        Args:
+            value: Query hash
+            radius: Maximum Hamming distance (inclusive)
+
+        Returns:
+            list: (distance, hash, payload) tuples sorted by distance
+        """
+        if self._root is None:
+            return []
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class DuplicateIndex:
+    """
+    Persistent near-duplicate index of processed images.
+
+    Signatures and processing results are stored in a local SQLite file.
+    Lookups use multi-index hashing: the 256-bit hash is split into
+    max_distance + 1 chunks, and any hash within max_distance bits matches
+    the query exactly in at least one of them. Each chunk is an indexed
+    column value, so candidates come from exact SQLite lookups; they are then
+    checked for Hamming distance and confirmed against their stored thumbnail.
+
+    Args:
+        path: SQLite database path (":memory:" for a transient index)
+        max_distance: Hamming threshold on the 256-bit dHash
+        max_block_diff: Largest thumbnail cell difference still considered the same page
+
+    Attributes:
+        max_distance: The configured Hamming threshold
+        max_block_diff: The configured thumbnail threshold
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        max_block_diff: int = DEFAULT_MAX_BLOCK_DIFF
+    ):
+        self.max_distance = max_distance
+        self.max_block_diff = max_block_diff
+        self._chunks = _chunk_layout(max_distance)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures "
+            "(hash TEXT PRIMARY KEY, thumbnail BLOB NOT NULL, result TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hash_chunks "
+            "(part INTEGER NOT NULL, value INTEGER NOT NULL, hash TEXT NOT NULL, "
+            "PRIMARY KEY (part, value, hash)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._reindex_if_needed()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def lookup(self, image_hash: int, thumbnail: bytes) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest previously processed image showing the same page.
+
+        Args:
+            image_hash: dHash of the new image (see image_signature)
+            thumbnail: Thumbnail of the new image (see image_signature)
+
+        Returns:
+            tuple: (stored result, distance) of the nearest confirmed match,
+            or None if no stored image is within both thresholds
+        """
+        with self._lock:
+            candidates = set()
+            for part, value in enumerate(self._chunk_values(image_hash)):
+                candidates.update(hash_hex for (hash_hex,) in self._conn.execute(
+                    "SELECT hash FROM hash_chunks WHERE part = ? AND value = ?", (part, value)
+                ))
+
+            nearby = sorted(
+                (hamming(image_hash, int(hash_hex, 16)), hash_hex) for hash_hex in candidates
+            )
+            for distance, hash_hex in nearby:
+                if distance > self.max_distance:
+                    break
+                stored_thumbnail, result = self._conn.execute(
+                    "SELECT thumbnail, result FROM signatures WHERE hash = ?", (hash_hex,)
+                ).fetchone()
+                if block_difference(thumbnail, stored_thumbnail) <= self.max_block_diff:
+                    return result, distance
+        return None
+
+    def add(self, image_hash: int, thumbnail: bytes, result: str) -> None:
+        """
+        Record the processing result for an image.
+
+        Args:
+            image_hash: dHash of the processed image
+            thumbnail: Thumbnail of the processed image
+            result: JSON result string
+        """
+        hash_hex = _hex(image_hash)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO signatures (hash, thumbnail, result) VALUES (?, ?, ?)",
+                (hash_hex, thumbnail, result)
+            )
+            if cursor.rowcount:
+                self._insert_chunks(image_hash, hash_hex)
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self._conn.close()
+
+    def _chunk_values(self, image_hash: int) -> List[int]:
+        """Split a hash into its per-chunk values."""
+        return [(image_hash >> shift) & ((1 << width) - 1) for shift, width in self._chunks]
+
+    def _insert_chunks(self, image_hash: int, hash_hex: str) -> None:
+        """Add the chunk index rows of one stored hash."""
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO hash_chunks (part, value, hash) VALUES (?, ?, ?)",
+            [(part, value, hash_hex) for part, value in enumerate(self._chunk_values(image_hash))]
+        )
+
+    def _reindex_if_needed(self) -> None:
+        """
+        Rebuild the chunk index when it was written with a different layout.
+
+        Happens once after max_distance changes (or for databases written
+        before the chunk index existed); otherwise opening is constant time.
+        """
+        layout = ",".join(str(width) for _, width in self._chunks)
+        stored = self._conn.execute("SELECT value FROM settings WHERE key = 'chunk_layout'").fetchone()
+        if stored is not None and stored[0] == layout:
+            return
+
+        self._conn.execute("DELETE FROM hash_chunks")
+        for (hash_hex,) in self._conn.execute("SELECT hash FROM signatures").fetchall():
+            self._insert_chunks(int(hash_hex, 16), hash_hex)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('chunk_layout', ?)", (layout,)
+        )
+        self._conn.commit()
+
+
+def _chunk_layout(max_distance: int) -> List[Tuple[int, int]]:
+    """
+    Split the 256-bit dedup hash into (shift, width) chunks for multi-index hashing.
+
+    At least max_distance + 1 chunks are needed for the pigeonhole guarantee;
+    at least five keep every chunk within a 64-bit SQLite integer.
+    """
+    bits = DEDUP_HASH_SIZE * DEDUP_HASH_SIZE
+    count = min(max(max_distance + 1, MIN_CHUNKS), bits)
+    chunks = []
+    shift = 0
+    for part in range(count):
+        width = bits // count + (part < bits % count)
+        chunks.append((shift, width))
+        shift += width
+    return chunks
+
+
+def _hex(image_hash: int) -> str:
+    """Fixed-width hex key of a 256-bit hash."""
+    return format(image_hash, f"0{DEDUP_HASH_SIZE * DEDUP_HASH_SIZE // 4}x")
@@ -1,4 +1,7 @@
 from backend import Backend, BackendType
+from regions import RegionCache
+from usage import UsageTracker
+from workers import create_image_pool, image_workers
 from os import getenv
 from dotenv import load_dotenv
 import argparse
@@ -8,64 +11,145 @@ import sys
 load_dotenv()
 
 
+def process_image(backend, image_path, debug=False):
+    """
+    Detect and extract a single invoice image.
+
+    Args:
+        backend: Backend instance to use
+        image_path: Path to the image file
+        debug: Print detailed progress output
+
+    Returns:
+        dict: Extracted properties, or {"invoice": False}
+    """
+    if debug:
+        print(f"\n--- Testing invoice detection on: {image_path} ---")
+
+    result = backend.invoice_or_not(image_path)
+
+    if debug:
+        print(f"Result: {result}")
+
+    invoice_data = json.loads(result)
+
+    if not invoice_data.get("invoice"):
+        if debug:
+            print("Image is not an invoice.")
+        return {"invoice": False}
+
+    if debug:
+        print("\n--- Invoice detected! Extracting properties ---")
+
+    properties = backend.invoice_properties(image_path)
+
+    if debug:
+        print(f"Properties: {properties}")
+
+    props_data = json.loads(properties)
+
+    if debug:
+        print("\n--- Extracted Data ---")
+        print(f"Date: {props_data.get('invoice_date')}")
+        print(f"Total: {props_data.get('total_amount')}")
+        print(f"Currency: {props_data.get('currency')}")
+
+    return props_data
+
+
 def main():
     parser = argparse.ArgumentParser(description="Invoice processing CLI")
     parser.add_argument("backend", type=BackendType, choices=list(BackendType),
                         help="Backend to use")
-    parser.add_argument("image_path", help="Path to invoice image")
+    parser.add_argument("image_paths", nargs="+", metavar="image_path",
+                        help="Path(s) to invoice image(s)")
     parser.add_argument("--model", help="Model (required for openrouter/ollama)")
     parser.add_argument("--url", default=getenv("LLAMA_SERVER_URL", "http://localhost:8080/v1"),
                         help="Server URL for llama backend")
     parser.add_argument("--debug", action="store_true",
                         help="Enable detailed debug output")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print token/cost usage summary to stderr")
+    parser.add_argument("--max-tokens", type=int,
+                        help="Token budget for the run")
+    parser.add_argument("--max-cost", type=float,
+                        help="Cost budget for the run (OpenRouter credits)")
+    parser.add_argument("--fallback", type=BackendType, choices=list(BackendType),
+                        help="Cheaper backend to switch to when a budget is exceeded "
+                             "(the fallback is not budgeted)")
+    parser.add_argument("--fallback-model", help="Model for the fallback backend")
+    parser.add_argument("--roi", action="store_true",
+                        help="Extract from cropped date/totals regions instead of the full page")
+    parser.add_argument("--workers", type=int, default=image_workers(),
+                        help="Processes for region hashing and cropping with --roi (0 = inline)")
 
     args = parser.parse_args()
+    usage = UsageTracker()
+    stopped = False
+    downgraded = False
+    failed = 0
+    image_pool = create_image_pool(args.workers) if args.roi else None
+    region_cache = RegionCache() if args.roi else None
 
     try:
-        backend = Backend(type=args.backend, base_url=args.url, model=args.model)
+        backend = Backend(type=args.backend, base_url=args.url, model=args.model, usage=usage,
+                          image_pool=image_pool, region_cache=region_cache)
 
         if args.debug:
             print(f"Connecting to {args.url}")
-            print(f"\n--- Testing invoice detection on: {args.image_path} ---")
 
-        result = backend.invoice_or_not(args.image_path)
+        for index, image_path in enumerate(args.image_paths):
+            if not downgraded and usage.exceeds(args.max_tokens, args.max_cost):
+                if args.fallback is None:
+                    print(f"Budget exceeded after {index} image(s); stopping", file=sys.stderr)
+                    stopped = True
+                    break
+                print(f"Budget exceeded after {index} image(s); switching to {args.fallback.value}",
+                      file=sys.stderr)
+                backend = Backend(type=args.fallback, base_url=args.url,
+                                  model=args.fallback_model, usage=usage, image_pool=image_pool,
+                                  region_cache=region_cache)
+                downgraded = True
+
+            # Hash (and, for known layouts, crop) the next images while this one waits on the model
+            for upcoming in args.image_paths[index:index + args.workers + 1]:
+                backend.prefetch_regions(upcoming)
+
+            try:
+                print(json.dumps(process_image(backend, image_path, args.debug)))
+            except FileNotFoundError:
+                failed += 1
+                error = f"Could not find file '{image_path}'"
+            except json.JSONDecodeError as e:
+                failed += 1
+                error = f"Failed to parse JSON response: {e}"
+            except Exception as e:
+                failed += 1
+                error = str(e) or type(e).__name__
+            else:
+                error = None
+
+            if error is not None:
+                print(f"Error: {error}", file=sys.stderr)
+                print(json.dumps({"image": image_path, "error": error}))
+            backend.release_prefetched(image_path)
 
-        if args.debug:
-            print(f"Result: {result}")
-
-        invoice_data = json.loads(result)
-
-        if invoice_data.get("invoice"):
             if args.debug:
-                print("\n--- Invoice detected! Extracting properties ---")
-
-            properties = backend.invoice_properties(args.image_path)
-
-            if args.debug:
-                print(f"Properties: {properties}")
-
-            props_data = json.loads(properties)
+                print(f"Usage: {json.dumps(usage.image(image_path))}")
 
-            if args.debug:
-                print("\n--- Extracted Data ---")
-                print(f"Date: {props_data.get('invoice_date')}")
-                print(f"Total: {props_data.get('total_amount')}")
-                print(f"Currency: {props_data.get('currency')}")
-
-            print(json.dumps(props_data))
-        else:
-            if args.debug:
-                print("Image is not an invoice.")
-            print(json.dumps({"invoice": False}))
-
-    except FileNotFoundError:
-        print(f"Error: Could not find file '{args.image_path}'", file=sys.stderr)
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error: Failed to parse JSON response: {e}", file=sys.stderr)
-        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
+        failed += 1
+    finally:
+        if image_pool is not None:
+            image_pool.shutdown(cancel_futures=True)
+
+    if args.debug:
+        print("\n--- Usage Summary ---")
+        print(json.dumps(usage.summary(), indent=2))
+    if args.summary:
+        print(json.dumps(usage.summary()), file=sys.stderr)
+    if stopped or failed:
         sys.exit(1)
 
 
@@ -0,0 +1,125 @@
+import base64
+import io
+import json
+import threading
+from typing import List, Optional
+
+from PIL import Image
+
+from dedup import BKTree
+
+DEFAULT_LAYOUT_DISTANCE = 10
+DEFAULT_PADDING = 0.02
+MIN_REGION_SIZE = 0.01
+
+Box = List[float]
+
+
+def parse_regions(response: str) -> List[Box]:
+    """
+    Parse a region-locating response into normalized boxes.
+
+    Coordinates are clamped to [0, 1] and boxes that are degenerate or
+    malformed are dropped.
+
+    Args:
+        response: JSON string matching INVOICE_REGIONS_SCHEMA
+
+    Returns:
+        list: [x0, y0, x1, y1] boxes as fractions of the page size
+    """
+    try:
+        regions = json.loads(response).get("regions") or []
+    except (json.JSONDecodeError, AttributeError):
+        return []
+
+    boxes = []
+    for region in regions:
+        try:
+            x0, y0, x1, y1 = (min(max(float(region[key]), 0.0), 1.0) for key in ("x0", "y0", "x1", "y1"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        if x1 - x0 >= MIN_REGION_SIZE and y1 - y0 >= MIN_REGION_SIZE:
+            boxes.append([x0, y0, x1, y1])
+    return boxes
+
+
+def crop_regions(image_path: str, boxes: List[Box], padding: float = DEFAULT_PADDING) -> List[str]:
+    """
+    Crop regions from an image at its native resolution.
+
+    Args:
+        image_path: Path to the image file
+        boxes: [x0, y0, x1, y1] boxes as fractions of the page size
+        padding: Margin added around each box, as a fraction of the page size
+
+    Returns:
+        list: Base64 encoded JPEG crops, one per box
+    """
+    crops = []
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        for x0, y0, x1, y1 in boxes:
+            area = (
+                int(max(x0 - padding, 0.0) * width),
+                int(max(y0 - padding, 0.0) * height),
+                int(min(x1 + padding, 1.0) * width),
+                int(min(y1 + padding, 1.0) * height)
+            )
+            buffer = io.BytesIO()
+            image.crop(area).save(buffer, format="JPEG", quality=90)
+            crops.append(base64.b64encode(buffer.getvalue()).decode("utf-8"))
+    return crops
+
+
+class RegionCache:
+    """
+    Cache of region boxes per document layout.
+
+    Layouts are identified by the perceptual hash of the page; invoices from
+    the same template hash within a few bits of each other and reuse the
+    boxes located for the first one, skipping the locating call. An empty
+    box list is a negative entry: pages of that layout are sent in full.
+
+    Args:
+        max_distance: Hamming threshold for two pages sharing a layout
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_LAYOUT_DISTANCE):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._boxes = {}
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def lookup(self, layout_hash: int) -> Optional[List[Box]]:
+        """Return the boxes cached for the nearest matching layout, or None."""
+        with self._lock:
+            key = self._nearest(layout_hash)
+            return self._boxes[key] if key is not None else None
+
+    def add(self, layout_hash: int, boxes: List[Box]) -> None:
+        """Cache the boxes located for a layout (an empty list for none)."""
+        with self._lock:
+            if layout_hash not in self._boxes:
+                self._tree.add(layout_hash)
+            self._boxes[layout_hash] = boxes
+
+    def remove(self, layout_hash: int) -> None:
+        """Forget the entry of the nearest matching layout, if any."""
+        with self._lock:
+            key = self._nearest(layout_hash)
+            if key is not None:
+                del self._boxes[key]
+
+    def _nearest(self, layout_hash: int) -> Optional[int]:
+        """Hash of the nearest live entry within max_distance."""
+        for _, key, _ in self._tree.search(layout_hash, self.max_distance):
+            if key in self._boxes:
+                return key
+        return None
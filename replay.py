@@ -0,0 +1,337 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import requests
+
+from traffic import load_traffic
+
+SATURATION_RATIO = 0.9
+STUB_PROPERTIES = {"invoice_date": "2024-01-15", "total_amount": 123.45, "currency": "EUR"}
+SERVER_START_TIMEOUT = 30
+
+
+def synthetic_image(index: int, size: int) -> bytes:
+    """
+    Create a unique stand-in upload of the recorded size.
+
+    Recorded images are only known by hash, so replay sends deterministic
+    random bytes; the stub backend recognizes them by their digest.
+    """
+    return index.to_bytes(8, "big") + random.Random(index).randbytes(max(size - 8, 0))
+
+
+def replay_plan(records: List[dict]) -> Tuple[List[bytes], Dict[str, dict]]:
+    """
+    Build the uploads for recorded traffic and the stub's view of them.
+
+    Args:
+        records: Traffic records in arrival order
+
+    Returns:
+        tuple: (upload bytes per record, records keyed by upload SHA-256)
+    """
+    payloads = [synthetic_image(index, record.get("image_bytes", 0)) for index, record in enumerate(records)]
+    plan = {hashlib.sha256(payload).hexdigest(): record for payload, record in zip(payloads, records)}
+    return payloads, plan
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values (0 for an empty list)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class StubClient:
+    """
+    OpenAI-compatible client stand-in that replays recorded model latencies.
+
+    Each request's image is matched to its traffic record by digest; its
+    model calls sleep for the recorded latencies in order and return answers
+    that follow the recorded outcome. For requests recorded as errors, the
+    call after the last recorded one raises, so the request fails again.
+
+    Args:
+        plan: Traffic records keyed by the SHA-256 of their synthetic upload
+    """
+
+    def __init__(self, plan: Dict[str, dict]):
+        self.plan = plan
+        self._lock = threading.Lock()
+        self._next_call = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.models = SimpleNamespace(list=lambda: [])
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create(self, model, messages, response_format, **kwargs):
+        """Sleep for the next recorded call latency and return a canned answer."""
+        image_url = next(part["image_url"]["url"] for part in messages[0]["content"] if part["type"] == "image_url")
+        digest = hashlib.sha256(base64.b64decode(image_url.split(",", 1)[1])).hexdigest()
+        record = self.plan.get(digest, {})
+
+        with self._lock:
+            index = self._next_call.get(digest, 0)
+            self._next_call[digest] = index + 1
+        calls = record.get("calls") or []
+        if record.get("outcome") == "error" and index >= len(calls):
+            raise RuntimeError("Replaying a request that failed when recorded")
+        call = calls[index] if index < len(calls) else {}
+        time.sleep((call.get("latency_ms") or 0) / 1000)
+
+        schema = response_format.get("json_schema", {}).get("name")
+        if schema == "response":
+            content = {"invoice": record.get("outcome") != "not_invoice"}
+        elif schema == "regions_schema":
+            content = {"regions": []}
+        else:
+            content = STUB_PROPERTIES
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+            usage=SimpleNamespace(prompt_tokens=call.get("total_tokens", 0), completion_tokens=0,
+                                  total_tokens=call.get("total_tokens", 0), cost=call.get("cost", 0))
+        )
+
+
+def serve_stub(traffic_path: str, port: int) -> None:
+    """
+    Run the API with its backend client replaced by a StubClient.
+
+    Duplicate detection and traffic recording are disabled so every replayed
+    request reaches the (stubbed) backend and production logs stay untouched.
+
+    Args:
+        traffic_path: Traffic log whose model calls the stub replays
+        port: Local port to listen on
+    """
+    # Empty rather than unset, so load_dotenv() in api does not restore them
+    os.environ["DEDUP_INDEX_PATH"] = ""
+    os.environ["TRAFFIC_LOG_PATH"] = ""
+    os.environ["WARMUP_INFERENCE"] = "0"
+    os.environ.setdefault("READY_TIMEOUT", "0.5")
+
+    import uvicorn
+    import api
+
+    _, plan = replay_plan(sorted(load_traffic(traffic_path), key=lambda record: record["ts"]))
+    create_backend = api.create_backend
+
+    def create_stub_backend(image_pool=None):
+        backend = create_backend(image_pool)
+        backend.client = StubClient(plan)
+        return backend
+
+    api.create_backend = create_stub_backend
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_stub_server(traffic_path: str) -> Tuple[subprocess.Popen, str]:
+    """
+    Start the stubbed API (see serve_stub) in a separate process.
+
+    The server gets its own interpreter so the replay client's threads do
+    not compete with it for the GIL and skew the latencies being measured.
+
+    Args:
+        traffic_path: Traffic log whose model calls the stub replays
+
+    Returns:
+        tuple: (server process, base URL)
+
+    Raises:
+        RuntimeError: If the server exits or does not become ready in time
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    # The API prints per-request notes to stdout, which would mix into --json output
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), traffic_path,
+                                "--stub-backend", "--port", str(port)], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Stub server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+
+    stop_stub_server(process)
+    raise RuntimeError("Stub server did not become ready")
+
+
+def stop_stub_server(process: subprocess.Popen) -> None:
+    """Stop a server started by start_stub_server()."""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def replay(records: List[dict], payloads: List[bytes], url: str, speed: float, concurrency: int) -> List[dict]:
+    """
+    Send recorded traffic with its original arrival pattern, time-scaled.
+
+    Args:
+        records: Traffic records in arrival order
+        payloads: Upload bytes for each record
+        url: Base URL of the API instance
+        speed: Time compression factor (5 replays at 5x the recorded rate)
+        concurrency: Maximum requests in flight from the client
+
+    Returns:
+        list: Per-request results with scheduled time, latency and status
+    """
+    sessions = threading.local()
+    first_ts = records[0]["ts"]
+    start = time.perf_counter()
+
+    def send(record, payload, scheduled):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        content_type = record.get("content_type") or "image/jpeg"
+        try:
+            status = sessions.session.post(
+                f"{url}/process", files={"file": ("replay", payload, content_type)}
+            ).status_code
+        except requests.RequestException:
+            status = None
+        done = time.perf_counter() - start
+        return {
+            "scheduled": scheduled,
+            "done": done,
+            "latency_ms": (done - scheduled) * 1000,
+            "service_ms": record.get("total_ms") or 0,
+            "status": status
+        }
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record, payload in zip(records, payloads):
+            scheduled = (record["ts"] - first_ts) / speed
+            delay = scheduled - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(send, record, payload, scheduled))
+    return [future.result() for future in futures]
+
+
+def summarize(results: List[dict], speed: float) -> dict:
+    """
+    Summarize one replay run.
+
+    Latency is measured from each request's scheduled arrival, so client-side
+    backlog counts as queueing. Queueing delay is the latency in excess of the
+    request's recorded server time. Offered and achieved rates are both taken
+    between the first and last event (arrivals, resp. completions), so an
+    unsaturated run, whose completions trail arrivals by the service time,
+    reports equal rates.
+
+    Args:
+        results: Output of replay()
+        speed: Time compression factor of the run
+
+    Returns:
+        dict: Offered and achieved rates, latency and queueing percentiles
+    """
+    latencies = [result["latency_ms"] for result in results]
+    queueing = [max(result["latency_ms"] - result["service_ms"], 0) for result in results]
+    scheduled = [result["scheduled"] for result in results]
+    # Replayed errors are answered too; only requests without a response count against throughput
+    done = [result["done"] for result in results if result["status"] is not None]
+    span = max(scheduled) - min(scheduled)
+    completion_span = max(done) - min(done) if done else 0
+    completed = len(done)
+
+    offered = (len(results) - 1) / span if span > 0 else 0
+    throughput = (completed - 1) / completion_span if completion_span > 0 else 0
+    return {
+        "speed": speed,
+        "requests": len(results),
+        "errors": sum(1 for result in results if result["status"] != 200),
+        "offered_rps": round(offered, 2),
+        "throughput_rps": round(throughput, 2),
+        "latency_ms": {f"p{pct}": round(percentile(latencies, pct), 1) for pct in (50, 95, 99)},
+        "queueing_ms": {f"p{pct}": round(percentile(queueing, pct), 1) for pct in (50, 95, 99)},
+        "saturated": offered > 0 and throughput < SATURATION_RATIO * offered
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded /process traffic against a local instance")
+    parser.add_argument("traffic", help="Traffic log written with TRAFFIC_LOG_PATH")
+    parser.add_argument("--speed", type=float, nargs="+", default=[1, 5, 10],
+                        help="Replay speed factors")
+    parser.add_argument("--concurrency", type=int, default=256,
+                        help="Maximum requests in flight from the replay client")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON")
+    parser.add_argument("--stub-backend", action="store_true",
+                        help="Serve the API with a stub backend for this log instead of replaying")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="Port for --stub-backend")
+
+    args = parser.parse_args()
+    if args.stub_backend:
+        serve_stub(args.traffic, args.port)
+        return
+
+    records = sorted(load_traffic(args.traffic), key=lambda record: record["ts"])
+    if not records:
+        print(f"Error: No traffic recorded in '{args.traffic}'", file=sys.stderr)
+        sys.exit(1)
+
+    payloads, _ = replay_plan(records)
+    reports = []
+    for speed in args.speed:
+        # A fresh server per speed restarts the stub's per-image call sequence
+        server, url = start_stub_server(args.traffic)
+        try:
+            reports.append(summarize(replay(records, payloads, url, speed, args.concurrency), speed))
+        finally:
+            stop_stub_server(server)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(f"{'speed':>6} {'offered/s':>10} {'done/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'queue p95':>10} {'errors':>7}")
+    for report in reports:
+        print(f"{report['speed']:>5}x {report['offered_rps']:>10} {report['throughput_rps']:>8} "
+              f"{report['latency_ms']['p50']:>8} {report['latency_ms']['p95']:>8} "
+              f"{report['latency_ms']['p99']:>8} {report['queueing_ms']['p95']:>10} {report['errors']:>7}"
+              f"{'  saturated' if report['saturated'] else ''}")
+
+    saturated = [report["speed"] for report in reports if report["saturated"]]
+    if saturated:
+        print(f"\nSaturation reached at {min(saturated)}x the recorded load")
+    else:
+        print(f"\nNo saturation up to {max(args.speed)}x the recorded load")
+
+
+if __name__ == "__main__":
+    main()
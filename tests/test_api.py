@@ -67,6 +67,72 @@ class TestProcessEndpoint:
         assert response.status_code == 200
         assert response.json()["error"] == "No invoice detected in image"
 
+    def test_duplicate_upload_skips_inference(self, test_client, mock_backend):
+        """Test that a near-duplicate upload returns the stored result."""
+        from dedup import DuplicateIndex
+
+        with patch("api.dedup_index", DuplicateIndex(":memory:")):
+            with patch("api.Backend", return_value=mock_backend):
+                for _ in range(2):
+                    with open("test_invoice.png", "rb") as f:
+                        response = test_client.post("/process", files={"file": ("test.png", f, "image/png")})
+
+        assert mock_backend.process_invoice.call_count == 1
+        data = response.json()
+        assert data["probable_duplicate"] is True
+        assert data["duplicate_distance"] == 0
+        assert data["currency"] == "EUR"
+
+    def test_non_invoice_result_is_not_indexed(self, test_client):
+        """Test that a None result (e.g. an unparseable reply) is not reused."""
+        from dedup import DuplicateIndex
+        mock_backend = MagicMock()
+        mock_backend.process_invoice.return_value = None
+
+        with patch("api.dedup_index", DuplicateIndex(":memory:")):
+            with patch("api.Backend", return_value=mock_backend):
+                for _ in range(2):
+                    with open("test_invoice.png", "rb") as f:
+                        response = test_client.post("/process", files={"file": ("test.png", f, "image/png")})
+
+        assert mock_backend.process_invoice.call_count == 2
+        assert "probable_duplicate" not in response.json()
+
+
+class TestUsageEndpoint:
+    """Tests for usage reporting."""
+
+    def test_usage_summary(self, test_client):
+        """Test that /usage reports run and per-model totals."""
+        response = test_client.get("/usage")
+        assert response.status_code == 200
+        assert set(response.json()) == {"run", "models"}
+
+    def test_process_response_includes_usage(self, test_client):
+        """Test that token usage of a real Backend reaches the /process response."""
+        from backend import Backend
+        client = MagicMock()
+        detection, extraction = MagicMock(), MagicMock()
+        detection.choices = [MagicMock(message=MagicMock(content='{"invoice": true}'))]
+        detection.usage = MagicMock(prompt_tokens=700, completion_tokens=5, total_tokens=705, cost=0)
+        extraction.choices = [MagicMock(message=MagicMock(content='{"currency": "EUR"}'))]
+        extraction.usage = MagicMock(prompt_tokens=800, completion_tokens=30, total_tokens=830, cost=0)
+        client.chat.completions.create.side_effect = [detection, extraction]
+
+        def create_backend(**kwargs):
+            backend = Backend(**kwargs)
+            backend.client = client
+            return backend
+
+        with patch("api.Backend", side_effect=create_backend):
+            with open("test_invoice.png", "rb") as f:
+                response = test_client.post("/process", files={"file": ("test.png", f, "image/png")})
+
+        usage = response.json()["usage"]
+        assert usage["calls"] == 2
+        assert usage["prompt_tokens"] == 1500
+        assert usage["total_tokens"] == 1535
+
 
 class TestStaticFiles:
     """Tests for static file serving."""
@@ -104,3 +170,62 @@ class TestHealthCheck:
         """Test that API root returns 200."""
         response = test_client.get("/")
         assert response.status_code == 200
+
+    def test_healthz(self, test_client):
+        """Test that the liveness probe returns 200."""
+        response = test_client.get("/healthz")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+    def test_readyz_before_startup(self, test_client):
+        """Test that the readiness probe fails until startup has run."""
+        response = test_client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+
+
+class TestLifespan:
+    """Tests for startup pre-connect, warm-up and readiness."""
+
+    def test_startup_preconnects_and_reports_ready(self, mock_backend):
+        """Test that startup pings the backend and shares it across requests."""
+        from api import app
+        mock_backend.ping.return_value = 0.0123
+
+        with patch("api.Backend", return_value=mock_backend) as mock_backend_class:
+            with TestClient(app) as client:
+                response = client.get("/readyz")
+                with open("test_invoice.png", "rb") as f:
+                    client.post("/process", files={"file": ("test.png", f, "image/png")})
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready", "backend": {"reachable": True, "latency_ms": 12.3}}
+        assert mock_backend_class.call_count == 1
+        mock_backend.process_invoice.assert_called_once()
+
+    def test_unreachable_backend_not_ready(self, mock_backend):
+        """Test that readiness fails while the backend is unreachable."""
+        from api import app
+        mock_backend.ping.side_effect = ConnectionError("refused")
+
+        with patch("api.Backend", return_value=mock_backend):
+            with TestClient(app) as client:
+                response = client.get("/readyz")
+                health = client.get("/healthz")
+
+        assert response.status_code == 503
+        assert response.json()["backend"] == {"reachable": False, "error": "refused"}
+        assert health.status_code == 200
+
+    def test_warmup_runs_inference_on_test_invoice(self, mock_backend, monkeypatch):
+        """Test that WARMUP_INFERENCE runs an inference at startup."""
+        from api import app
+        monkeypatch.setenv("WARMUP_INFERENCE", "1")
+        mock_backend.ping.return_value = 0.01
+
+        with patch("api.Backend", return_value=mock_backend):
+            with TestClient(app):
+                pass
+
+        image_path = mock_backend.process_invoice.call_args.args[0]
+        assert image_path.endswith("test_invoice.png")
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from backend import Backend, BackendType
+from usage import UsageTracker
 
 
 @pytest.fixture
@@ -96,3 +97,47 @@ class TestGenerateMethod:
             backend.generate("prompt", "test.jpg", {"type": "json_object"})
             call_args = mock_client.chat.completions.create.call_args
             assert call_args.kwargs["model"] == ""
+
+
+class TestPing:
+    def test_ping_lists_models(self, mock_client):
+        backend = Backend(type=BackendType.LLAMA)
+        backend.client = mock_client
+        latency = backend.ping(timeout=1.5)
+        mock_client.with_options.assert_called_once_with(timeout=1.5, max_retries=0)
+        mock_client.with_options.return_value.models.list.assert_called_once()
+        assert latency >= 0
+
+
+class TestUsageAccounting:
+    def test_generate_records_usage(self, mock_client):
+        mock_client.chat.completions.create.return_value.usage.prompt_tokens = 120
+        mock_client.chat.completions.create.return_value.usage.completion_tokens = 8
+        mock_client.chat.completions.create.return_value.usage.total_tokens = 128
+        mock_client.chat.completions.create.return_value.usage.cost = 0.002
+        with patch("base.encode_image", return_value="fake_base64"):
+            backend = Backend(type=BackendType.OPENROUTER, model="my-model", usage=UsageTracker())
+            backend.client = mock_client
+            backend.process_invoice("test.jpg")
+
+        assert backend.usage.image("test.jpg")["total_tokens"] == 256
+        assert backend.usage.summary()["models"]["openrouter/my-model"]["calls"] == 2
+        call_args = mock_client.chat.completions.create.call_args
+        assert call_args.kwargs["extra_body"] == {"usage": {"include": True}}
+
+    def test_llama_omits_openrouter_options(self, mock_client):
+        with patch("base.encode_image", return_value="fake_base64"):
+            backend = Backend(type=BackendType.LLAMA, usage=UsageTracker())
+            backend.client = mock_client
+            backend.invoice_or_not("test.jpg")
+
+        assert "extra_body" not in mock_client.chat.completions.create.call_args.kwargs
+        assert backend.usage.summary()["models"]["llama/default"]["calls"] == 1
+
+    def test_usage_is_not_tracked_by_default(self, mock_client):
+        with patch("base.encode_image", return_value="fake_base64"):
+            backend = Backend(type=BackendType.LLAMA)
+            backend.client = mock_client
+            backend.invoice_or_not("test.jpg")
+
+        assert backend.usage is None
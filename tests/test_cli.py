@@ -3,8 +3,10 @@ from unittest.mock import MagicMock, patch
 from main import main
 from backend import Backend, BackendType
 import argparse
+import json
 import sys
 from io import StringIO
+from types import SimpleNamespace
 
 
 @pytest.fixture
@@ -135,3 +137,97 @@ class TestBackendIntegration:
             mock_backend_class.assert_called_once()
             call_kwargs = mock_backend_class.call_args[1]
             assert call_kwargs["model"] == "some-model"
+
+
+class TestBatchAndBudget:
+    def make_backend(self, usage, tokens=100):
+        def invoice_or_not(image_path):
+            usage.record("test/model", image_path, SimpleNamespace(prompt_tokens=tokens, completion_tokens=0))
+            return '{"invoice": false}'
+
+        backend = MagicMock()
+        backend.invoice_or_not.side_effect = invoice_or_not
+        return backend
+
+    def test_processes_every_image(self, capsys):
+        with patch("main.Backend") as mock_backend_class:
+            mock_backend_class.side_effect = lambda **kwargs: self.make_backend(kwargs["usage"])
+
+            with patch.object(sys, "argv", ["main.py", "llama", "a.jpg", "b.jpg", "c.jpg", "--summary"]):
+                main()
+
+            captured = capsys.readouterr()
+            assert captured.out.count('{"invoice": false}') == 3
+            assert '"total_tokens": 300' in captured.err
+
+    def test_stops_when_budget_exceeded(self, capsys):
+        with patch("main.Backend") as mock_backend_class:
+            mock_backend_class.side_effect = lambda **kwargs: self.make_backend(kwargs["usage"])
+
+            with patch.object(sys, "argv", ["main.py", "llama", "a.jpg", "b.jpg", "c.jpg", "--max-tokens", "150"]):
+                with pytest.raises(SystemExit) as exc_info:
+                    main()
+
+            assert exc_info.value.code == 1
+            captured = capsys.readouterr()
+            assert captured.out.count('{"invoice": false}') == 2
+            assert "Budget exceeded after 2 image(s); stopping" in captured.err
+
+    def test_downgrades_to_fallback(self, capsys):
+        with patch("main.Backend") as mock_backend_class:
+            mock_backend_class.side_effect = lambda **kwargs: self.make_backend(kwargs["usage"])
+
+            with patch.object(sys, "argv", ["main.py", "openrouter", "a.jpg", "b.jpg", "c.jpg",
+                                            "--max-tokens", "50", "--fallback", "llama"]):
+                main()
+
+            assert mock_backend_class.call_count == 2
+            assert mock_backend_class.call_args.kwargs["type"] == BackendType.LLAMA
+            assert capsys.readouterr().out.count('{"invoice": false}') == 3
+
+    def test_failed_image_does_not_abort_batch(self, capsys):
+        with patch("main.Backend") as mock_backend_class:
+            def make(**kwargs):
+                backend = self.make_backend(kwargs["usage"])
+                default = backend.invoice_or_not.side_effect
+
+                def invoice_or_not(image_path):
+                    if image_path == "missing.jpg":
+                        raise FileNotFoundError(image_path)
+                    if image_path == "garbled.jpg":
+                        return "not json"
+                    if image_path == "oversized.jpg":
+                        raise RuntimeError("Error code: 413 - image too large")
+                    return default(image_path)
+
+                backend.invoice_or_not.side_effect = invoice_or_not
+                return backend
+
+            mock_backend_class.side_effect = make
+
+            with patch.object(sys, "argv", ["main.py", "llama", "a.jpg", "missing.jpg", "garbled.jpg",
+                                            "oversized.jpg", "b.jpg", "--summary"]):
+                with pytest.raises(SystemExit) as exc_info:
+                    main()
+
+            assert exc_info.value.code == 1
+            captured = capsys.readouterr()
+            lines = [json.loads(line) for line in captured.out.splitlines()]
+            assert lines[0] == {"invoice": False}
+            assert lines[1] == {"image": "missing.jpg", "error": "Could not find file 'missing.jpg'"}
+            assert lines[2]["image"] == "garbled.jpg"
+            assert lines[3] == {"image": "oversized.jpg", "error": "Error code: 413 - image too large"}
+            assert lines[4] == {"invoice": False}
+            assert '"total_tokens": 200' in captured.err
+
+    def test_prefetches_upcoming_images_with_workers(self, capsys):
+        with patch("main.Backend") as mock_backend_class, patch("main.create_image_pool") as create_pool:
+            backend = self.make_backend(MagicMock())
+            mock_backend_class.return_value = backend
+            with patch.object(sys, "argv", ["main.py", "llama", "a.jpg", "b.jpg", "c.jpg", "--roi", "--workers", "1"]):
+                main()
+
+        create_pool.assert_called_once_with(1)
+        prefetched = [call.args[0] for call in backend.prefetch_regions.call_args_list]
+        assert prefetched == ["a.jpg", "b.jpg", "b.jpg", "c.jpg", "c.jpg"]
+        assert [call.args[0] for call in backend.release_prefetched.call_args_list] == ["a.jpg", "b.jpg", "c.jpg"]
@@ -0,0 +1,133 @@
+import random
+import pytest
+from PIL import Image, ImageDraw
+from dedup import BKTree, DuplicateIndex, dhash, hamming, image_signature
+
+
+@pytest.fixture
+def invoice_copies(tmp_path):
+    original = Image.open("test_invoice.png").convert("RGB")
+    rescan = original.resize((original.width // 2, original.height // 2))
+    original_path = tmp_path / "original.png"
+    rescan_path = tmp_path / "rescan.jpg"
+    original.save(original_path)
+    rescan.save(rescan_path, quality=70)
+    return str(original_path), str(rescan_path)
+
+
+@pytest.fixture
+def edited_totals(tmp_path):
+    """Same invoice template with the date and totals blanked and rewritten."""
+    edited = Image.open("test_invoice.png").convert("RGB")
+    draw = ImageDraw.Draw(edited)
+    draw.rectangle((600, 292, 770, 318), fill="white")
+    draw.text((620, 298), "DATE: 11-03-91", fill="black")
+    draw.rectangle((560, 575, 770, 625), fill="white")
+    draw.text((600, 582), "2,450.00", fill="black")
+    draw.text((600, 606), "1,100.00", fill="black")
+    draw.rectangle((630, 675, 770, 715), fill="white")
+    draw.text((650, 688), "$3,550.00", fill="black")
+    edited_path = tmp_path / "edited.png"
+    edited.save(edited_path)
+    return str(edited_path)
+
+
+class TestDHash:
+    def test_rescan_is_close(self, invoice_copies):
+        original, rescan = invoice_copies
+        assert hamming(dhash(original), dhash(rescan)) <= 6
+
+    def test_different_image_is_far(self, invoice_copies, tmp_path):
+        original, _ = invoice_copies
+        gradient = Image.linear_gradient("L").rotate(90)
+        gradient_path = tmp_path / "gradient.png"
+        gradient.save(gradient_path)
+        assert hamming(dhash(original), dhash(str(gradient_path))) > 6
+
+
+class TestBKTree:
+    def test_search_matches_linear_scan(self):
+        values = [(i * 2654435761) & 0xFFFFFFFFFFFFFFFF for i in range(500)]
+        tree = BKTree()
+        for value in values:
+            tree.add(value, value)
+
+        query = values[42] ^ 0b1011
+        expected = sorted(v for v in values if hamming(query, v) <= 20)
+        found = sorted(payload for _, _, payload in tree.search(query, 20))
+        assert found == expected
+        assert len(tree) == 500
+
+    def test_search_sorted_by_distance(self):
+        tree = BKTree()
+        tree.add(0b1111, "far")
+        tree.add(0b0001, "near")
+        results = tree.search(0b0000, 4)
+        assert [payload for _, _, payload in results] == ["near", "far"]
+
+    def test_empty_tree(self):
+        assert BKTree().search(0, 10) == []
+
+
+class TestDuplicateIndex:
+    def test_rescan_is_duplicate(self, invoice_copies):
+        original, rescan = invoice_copies
+        index = DuplicateIndex(":memory:")
+        index.add(*image_signature(original), '{"currency": "USD"}')
+
+        result, distance = index.lookup(*image_signature(rescan))
+        assert result == '{"currency": "USD"}'
+        assert distance <= index.max_distance
+
+    def test_edited_totals_is_not_duplicate(self, invoice_copies, edited_totals):
+        original, _ = invoice_copies
+        index = DuplicateIndex(":memory:")
+        index.add(*image_signature(original), '{"currency": "USD"}')
+
+        edited_hash, edited_thumbnail = image_signature(edited_totals)
+        assert hamming(edited_hash, image_signature(original)[0]) <= index.max_distance
+        assert index.lookup(edited_hash, edited_thumbnail) is None
+
+    def test_hash_outside_threshold(self):
+        index = DuplicateIndex(":memory:", max_distance=2)
+        index.add(0b1000, bytes(16), '{"currency": "EUR"}')
+        assert index.lookup(0b1001, bytes(16)) == ('{"currency": "EUR"}', 1)
+        assert index.lookup(0b0111, bytes(16)) is None
+
+    def test_persists_between_instances(self, tmp_path):
+        path = str(tmp_path / "index.sqlite")
+        index = DuplicateIndex(path)
+        index.add(12345, bytes(16), "{}")
+        index.add(12345, bytes(16), "{}")
+        index.close()
+
+        reopened = DuplicateIndex(path)
+        assert len(reopened) == 1
+        assert reopened.lookup(12345, bytes(16)) == ("{}", 0)
+
+    def test_lookup_matches_linear_scan(self):
+        rng = random.Random(7)
+        index = DuplicateIndex(":memory:", max_distance=10)
+        stored = [rng.getrandbits(256) for _ in range(200)]
+        for i, value in enumerate(stored):
+            index.add(value, bytes(16), str(i))
+
+        for i, value in enumerate(stored[:50]):
+            query = value
+            for bit in rng.sample(range(256), rng.randint(0, 12)):
+                query ^= 1 << bit
+            expected = min((hamming(query, v), j) for j, v in enumerate(stored))
+            found = index.lookup(query, bytes(16))
+            if expected[0] <= 10:
+                assert found == (str(expected[1]), expected[0])
+            else:
+                assert found is None
+
+    def test_reindexes_when_threshold_changes(self, tmp_path):
+        path = str(tmp_path / "index.sqlite")
+        index = DuplicateIndex(path, max_distance=2)
+        index.add(0, bytes(16), "{}")
+        index.close()
+
+        reopened = DuplicateIndex(path, max_distance=12)
+        assert reopened.lookup((1 << 12) - 1, bytes(16)) == ("{}", 12)
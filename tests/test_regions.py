@@ -0,0 +1,156 @@
+import base64
+import io
+import json
+from unittest.mock import MagicMock
+from PIL import Image
+from backend import Backend, BackendType
+from regions import RegionCache, crop_regions, parse_regions
+from utils import INVOICE_PROPERTIES_PROMPT, INVOICE_REGIONS_PROMPT
+
+REGIONS = '{"regions": [{"x0": 0.6, "y0": 0.05, "x1": 0.95, "y1": 0.15}, {"x0": 0.5, "y0": 0.8, "x1": 0.95, "y1": 0.95}]}'
+PROPERTIES = '{"invoice_date": "2024-01-15", "total_amount": 123.45, "currency": "EUR"}'
+EMPTY_PROPERTIES = '{"invoice_date": null, "total_amount": null, "currency": null}'
+
+
+def make_client(*responses):
+    client = MagicMock()
+    completions = []
+    for content in responses:
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = content
+        completions.append(completion)
+    client.chat.completions.create.side_effect = completions
+    return client
+
+
+def sent_images(call):
+    return [part for part in call.kwargs["messages"][0]["content"] if part["type"] == "image_url"]
+
+
+def sent_prompt(call):
+    return call.kwargs["messages"][0]["content"][0]["text"]
+
+
+class TestParseRegions:
+    def test_parses_and_clamps(self):
+        boxes = parse_regions('{"regions": [{"x0": 0.9, "y0": -0.1, "x1": 0.2, "y1": 1.4}]}')
+        assert boxes == [[0.2, 0.0, 0.9, 1.0]]
+
+    def test_drops_degenerate_and_malformed(self):
+        response = '{"regions": [{"x0": 0.5, "y0": 0.5, "x1": 0.5, "y1": 0.9}, {"x0": "a"}, {"x0": 0.1}]}'
+        assert parse_regions(response) == []
+        assert parse_regions("not json") == []
+
+
+class TestCropRegions:
+    def test_crops_at_native_resolution(self):
+        width, height = Image.open("test_invoice.png").size
+        crops = crop_regions("test_invoice.png", [[0.5, 0.5, 1.0, 1.0]], padding=0)
+
+        assert len(crops) == 1
+        crop = Image.open(io.BytesIO(base64.b64decode(crops[0])))
+        assert crop.format == "JPEG"
+        assert crop.size == (width - width // 2, height - height // 2)
+
+
+class TestRegionCache:
+    def test_similar_layout_reuses_boxes(self):
+        cache = RegionCache(max_distance=4)
+        cache.add(0b1111_0000, [[0.1, 0.1, 0.2, 0.2]])
+        assert cache.lookup(0b1111_0011) == [[0.1, 0.1, 0.2, 0.2]]
+        assert cache.lookup(0b0000_1111) is None
+
+    def test_remove_and_negative_entry(self):
+        cache = RegionCache(max_distance=4)
+        cache.add(0b1111_0000, [[0.1, 0.1, 0.2, 0.2]])
+        cache.remove(0b1111_0001)
+        assert cache.lookup(0b1111_0000) is None
+        assert len(cache) == 0
+
+        cache.add(0b1111_0000, [])
+        assert cache.lookup(0b1111_0011) == []
+
+
+class TestRegionExtraction:
+    def test_extracts_from_crops(self):
+        client = make_client(REGIONS, PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        assert backend.invoice_properties("test_invoice.png") == PROPERTIES
+        locate, extract = client.chat.completions.create.call_args_list
+        assert sent_prompt(locate) == INVOICE_REGIONS_PROMPT
+        assert len(sent_images(extract)) == 2
+        assert sent_prompt(extract).endswith(INVOICE_PROPERTIES_PROMPT)
+
+    def test_layout_cache_skips_locating_call(self):
+        client = make_client(REGIONS, PROPERTIES, PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        backend.invoice_properties("test_invoice.png")
+        backend.invoice_properties("test_invoice.png")
+        assert client.chat.completions.create.call_count == 3
+        assert len(backend.region_cache) == 1
+
+    def test_falls_back_to_full_page_without_regions(self):
+        client = make_client('{"regions": []}', PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        assert backend.invoice_properties("test_invoice.png") == PROPERTIES
+        extract = client.chat.completions.create.call_args_list[1]
+        assert sent_prompt(extract) == INVOICE_PROPERTIES_PROMPT
+        assert len(sent_images(extract)) == 1
+
+    def test_falls_back_to_full_page_when_crops_unreadable(self):
+        client = make_client(REGIONS, EMPTY_PROPERTIES, PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        assert json.loads(backend.invoice_properties("test_invoice.png"))["currency"] == "EUR"
+        assert client.chat.completions.create.call_count == 3
+
+    def test_partial_crop_result_filled_from_full_page(self):
+        partial = '{"invoice_date": "2024-01-15", "total_amount": null, "currency": null}'
+        full_page = '{"invoice_date": "2024-01-16", "total_amount": 123.45, "currency": "EUR"}'
+        client = make_client(REGIONS, partial, full_page)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        result = json.loads(backend.invoice_properties("test_invoice.png"))
+        assert result == {"invoice_date": "2024-01-15", "total_amount": 123.45, "currency": "EUR"}
+        extract = client.chat.completions.create.call_args_list[2]
+        assert sent_prompt(extract) == INVOICE_PROPERTIES_PROMPT
+        assert len(sent_images(extract)) == 1
+
+    def test_layout_without_regions_is_not_located_again(self):
+        client = make_client('{"regions": []}', PROPERTIES, PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        backend.invoice_properties("test_invoice.png")
+        backend.invoice_properties("test_invoice.png")
+        assert client.chat.completions.create.call_count == 3
+        assert sent_prompt(client.chat.completions.create.call_args_list[2]) == INVOICE_PROPERTIES_PROMPT
+
+    def test_failing_boxes_are_dropped_for_layout(self):
+        client = make_client(REGIONS, EMPTY_PROPERTIES, PROPERTIES, PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.client = client
+
+        backend.invoice_properties("test_invoice.png")
+        assert backend.invoice_properties("test_invoice.png") == PROPERTIES
+        assert client.chat.completions.create.call_count == 4
+        last = client.chat.completions.create.call_args_list[3]
+        assert sent_prompt(last) == INVOICE_PROPERTIES_PROMPT
+        assert len(sent_images(last)) == 1
+
+    def test_disabled_by_default(self):
+        client = make_client(PROPERTIES)
+        backend = Backend(type=BackendType.LLAMA)
+        backend.client = client
+
+        backend.invoice_properties("test_invoice.png")
+        assert client.chat.completions.create.call_count == 1
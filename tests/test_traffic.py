@@ -0,0 +1,191 @@
+import base64
+import hashlib
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from replay import (StubClient, percentile, replay, replay_plan, start_stub_server, stop_stub_server,
+                    summarize, synthetic_image)
+from traffic import TrafficRecorder, file_sha256, load_traffic
+from utils import invoice_detection_response_format, invoice_properties_response_format
+
+
+def stub_call(client, payload, response_format):
+    image = base64.b64encode(payload).decode("utf-8")
+    return client.chat.completions.create(
+        model="",
+        messages=[{"role": "user", "content": [
+            {"type": "text", "text": "prompt"},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}}
+        ]}],
+        response_format=response_format
+    )
+
+
+class TestTrafficRecorder:
+    def test_records_round_trip(self, tmp_path):
+        path = str(tmp_path / "traffic.jsonl")
+        recorder = TrafficRecorder(path)
+        recorder.record({"ts": 1.0, "filename": "a.png", "result": {"currency": "EUR"}})
+        recorder.close()
+        assert list(load_traffic(path)) == [{"ts": 1.0, "filename": "a.png", "result": {"currency": "EUR"}}]
+
+    def test_redaction_drops_sensitive_fields(self, tmp_path):
+        path = str(tmp_path / "traffic.jsonl")
+        recorder = TrafficRecorder(path, redact=True)
+        recorder.record({"ts": 1.0, "filename": "a.png", "result": {"currency": "EUR"}, "image_bytes": 10})
+        recorder.close()
+        assert list(load_traffic(path)) == [{"ts": 1.0, "image_bytes": 10}]
+
+
+class TestApiRecording:
+    @staticmethod
+    def stub_backend():
+        from backend import Backend
+        client = MagicMock()
+        detection, extraction = MagicMock(), MagicMock()
+        detection.choices = [MagicMock(message=MagicMock(content='{"invoice": true}'))]
+        detection.usage = MagicMock(prompt_tokens=700, completion_tokens=5, total_tokens=705, cost=0)
+        extraction.choices = [MagicMock(message=MagicMock(
+            content='{"invoice_date": null, "total_amount": 5, "currency": "EUR"}'))]
+        extraction.usage = MagicMock(prompt_tokens=800, completion_tokens=30, total_tokens=830, cost=0)
+        client.chat.completions.create.side_effect = [detection, extraction]
+
+        def create_backend(**kwargs):
+            backend = Backend(**kwargs)
+            backend.client = client
+            return backend
+        return create_backend
+
+    def test_process_request_is_recorded(self, tmp_path):
+        from api import app
+        recorder = TrafficRecorder(str(tmp_path / "traffic.jsonl"))
+
+        with patch("api.traffic_recorder", recorder), patch("api.Backend", side_effect=self.stub_backend()):
+            with open("test_invoice.png", "rb") as f:
+                TestClient(app).post("/process", files={"file": ("scan.png", f, "image/png")})
+        recorder.close()
+
+        (entry,) = load_traffic(str(tmp_path / "traffic.jsonl"))
+        assert entry["image_sha256"] == file_sha256("test_invoice.png")
+        assert entry["image_bytes"] == len(open("test_invoice.png", "rb").read())
+        assert entry["filename"] == "scan.png"
+        assert entry["status"] == 200
+        assert entry["outcome"] == "invoice"
+        assert entry["result"] == {"invoice_date": None, "total_amount": 5, "currency": "EUR"}
+        assert {"upload_ms", "inference_ms"} <= set(entry["stages"])
+        assert entry["total_ms"] >= entry["stages"]["inference_ms"]
+        assert [call["total_tokens"] for call in entry["calls"]] == [705, 830]
+        assert all(call["latency_ms"] is not None for call in entry["calls"])
+
+    def test_recording_failure_keeps_response_and_cleans_up(self):
+        from api import app
+        recorder = MagicMock()
+        recorder.record.side_effect = OSError("disk full")
+
+        with patch("api.traffic_recorder", recorder), patch("api.Backend", side_effect=self.stub_backend()), \
+                patch("api.Path.unlink") as unlink:
+            with open("test_invoice.png", "rb") as f:
+                response = TestClient(app).post("/process", files={"file": ("scan.png", f, "image/png")})
+
+        assert response.status_code == 200
+        assert response.json()["currency"] == "EUR"
+        unlink.assert_called_once()
+
+
+class TestStubClient:
+    def test_replays_recorded_calls_in_order(self):
+        payload = synthetic_image(0, 64)
+        record = {"outcome": "invoice", "calls": [
+            {"latency_ms": 1, "total_tokens": 10, "cost": 0},
+            {"latency_ms": 2, "total_tokens": 20, "cost": 0}
+        ]}
+        client = StubClient({hashlib.sha256(payload).hexdigest(): record})
+
+        detection = stub_call(client, payload, invoice_detection_response_format())
+        extraction = stub_call(client, payload, invoice_properties_response_format())
+        assert json.loads(detection.choices[0].message.content) == {"invoice": True}
+        assert detection.usage.total_tokens == 10
+        assert extraction.usage.total_tokens == 20
+        assert "currency" in json.loads(extraction.choices[0].message.content)
+
+    def test_follows_recorded_outcome(self):
+        payload = synthetic_image(1, 64)
+        client = StubClient({hashlib.sha256(payload).hexdigest(): {"outcome": "not_invoice", "calls": []}})
+        detection = stub_call(client, payload, invoice_detection_response_format())
+        assert json.loads(detection.choices[0].message.content) == {"invoice": False}
+
+    def test_recorded_error_fails_after_recorded_calls(self):
+        payload = synthetic_image(2, 64)
+        record = {"outcome": "error", "calls": [{"latency_ms": 1, "total_tokens": 10, "cost": 0}]}
+        client = StubClient({hashlib.sha256(payload).hexdigest(): record})
+
+        stub_call(client, payload, invoice_detection_response_format())
+        with pytest.raises(RuntimeError):
+            stub_call(client, payload, invoice_properties_response_format())
+
+
+class TestStubServer:
+    def test_replays_outcomes_against_separate_process(self, tmp_path):
+        path = tmp_path / "traffic.jsonl"
+        records = [
+            {"ts": 0.0, "image_bytes": 256, "outcome": "invoice", "total_ms": 5,
+             "calls": [{"latency_ms": 1, "total_tokens": 10}, {"latency_ms": 1, "total_tokens": 20}]},
+            {"ts": 0.1, "image_bytes": 256, "outcome": "error", "total_ms": 5, "calls": []}
+        ]
+        path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+        payloads, _ = replay_plan(records)
+        server, url = start_stub_server(str(path))
+        try:
+            results = replay(records, payloads, url, 10, 4)
+        finally:
+            stop_stub_server(server)
+
+        assert [result["status"] for result in results] == [200, 500]
+        assert server.returncode is not None
+
+
+class TestReplayReport:
+    def test_synthetic_images_are_unique_and_sized(self):
+        assert len(synthetic_image(3, 1000)) == 1000
+        assert synthetic_image(3, 1000) == synthetic_image(3, 1000)
+        assert synthetic_image(3, 1000) != synthetic_image(4, 1000)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 95) == 0
+
+    def test_summarize_detects_saturation(self):
+        results = [
+            {"scheduled": i * 0.1, "done": i * 0.5 + 0.2, "latency_ms": (i * 0.4 + 0.2) * 1000,
+             "service_ms": 200, "status": 200}
+            for i in range(11)
+        ]
+        report = summarize(results, 5)
+        assert report["offered_rps"] == 10
+        assert report["throughput_rps"] == 2
+        assert report["queueing_ms"]["p50"] == 2000
+        assert report["saturated"] is True
+
+    def test_summarize_unsaturated_run(self):
+        results = [
+            {"scheduled": i * 0.1, "done": i * 0.1 + 0.2, "latency_ms": 200, "service_ms": 200, "status": 200}
+            for i in range(11)
+        ]
+        report = summarize(results, 1)
+        assert report["offered_rps"] == report["throughput_rps"] == 10
+        assert report["queueing_ms"]["p99"] == 0
+        assert report["saturated"] is False
+
+    def test_summarize_counts_error_responses_as_served(self):
+        results = [
+            {"scheduled": i * 0.1, "done": i * 0.1 + 0.2, "latency_ms": 200, "service_ms": 200,
+             "status": 500 if i % 2 else 200}
+            for i in range(11)
+        ]
+        report = summarize(results, 1)
+        assert report["errors"] == 5
+        assert report["saturated"] is False
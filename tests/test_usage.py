@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from usage import UsageTracker
+
+
+def make_usage(prompt, completion, cost=None):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion,
+                           total_tokens=prompt + completion, cost=cost)
+
+
+class TestUsageTracker:
+    def test_aggregates_per_image_model_and_run(self):
+        tracker = UsageTracker()
+        tracker.record("openrouter/a", "one.png", make_usage(100, 10, 0.5))
+        tracker.record("openrouter/a", "one.png", make_usage(200, 20, 0.25))
+        tracker.record("llama/default", "two.png", make_usage(50, 5))
+
+        assert tracker.image("one.png")["total_tokens"] == 330
+        assert tracker.image("one.png")["calls"] == 2
+        summary = tracker.summary()
+        assert summary["run"]["total_tokens"] == 385
+        assert summary["run"]["cost"] == 0.75
+        assert summary["models"]["llama/default"]["prompt_tokens"] == 50
+
+    def test_missing_usage_counts_call_only(self):
+        tracker = UsageTracker()
+        tracker.record("llama/default", "one.png", None)
+        assert tracker.image("one.png") == {
+            "calls": 1, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0
+        }
+
+    def test_pop_image_forgets_totals(self):
+        tracker = UsageTracker()
+        tracker.record("m", "one.png", make_usage(1, 1))
+        assert tracker.pop_image("one.png")["calls"] == 1
+        assert tracker.image("one.png")["calls"] == 0
+        assert tracker.summary()["run"]["calls"] == 1
+
+    def test_exceeds(self):
+        tracker = UsageTracker()
+        tracker.record("m", "one.png", make_usage(90, 20, 0.1))
+        assert not tracker.exceeds()
+        assert tracker.exceeds(max_tokens=100)
+        assert not tracker.exceeds(max_tokens=110)
+        assert tracker.exceeds(max_cost=0.05)
+
+    def test_keep_calls_records_latency_in_order(self):
+        tracker = UsageTracker(keep_calls=True)
+        tracker.record("m", "one.png", make_usage(10, 1), latency=0.25)
+        tracker.record("m", "one.png", make_usage(20, 2))
+        calls = tracker.pop_calls("one.png")
+        assert [call["latency_ms"] for call in calls] == [250.0, None]
+        assert calls[1]["total_tokens"] == 22
+        assert tracker.pop_calls("one.png") == []
+
+    def test_calls_not_kept_by_default(self):
+        tracker = UsageTracker()
+        tracker.record("m", "one.png", make_usage(10, 1), latency=0.25)
+        assert tracker.pop_calls("one.png") == []
@@ -0,0 +1,108 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from backend import Backend, BackendType
+from dedup import dhash
+from regions import RegionCache, crop_regions
+from utils import encode_image
+from workers import create_image_pool, image_workers
+
+
+@pytest.fixture(scope="module")
+def image_pool():
+    pool = create_image_pool(2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = '{"invoice": false}'
+    client.chat.completions.create.return_value = completion
+    return client
+
+
+def sent_image(client):
+    content = client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+    return content[1]["image_url"]["url"].split(",", 1)[1]
+
+
+class TestImagePool:
+    def test_zero_workers_means_inline(self, monkeypatch):
+        monkeypatch.delenv("IMAGE_WORKERS", raising=False)
+        assert image_workers() == 0
+        assert create_image_pool() is None
+
+    def test_workers_from_env(self, monkeypatch):
+        monkeypatch.setenv("IMAGE_WORKERS", "3")
+        assert image_workers() == 3
+        assert image_workers(1) == 1
+
+    def test_pool_results_match_inline(self, image_pool):
+        assert image_pool.submit(encode_image, "test_invoice.png").result() == encode_image("test_invoice.png")
+        assert image_pool.submit(dhash, "test_invoice.png").result() == dhash("test_invoice.png")
+
+
+class TestBackendImagePool:
+    def test_generate_encodes_inline(self, mock_client):
+        pool = MagicMock()
+        backend = Backend(type=BackendType.LLAMA, image_pool=pool)
+        backend.client = mock_client
+        backend.invoice_or_not("test_invoice.png")
+
+        pool.submit.assert_not_called()
+        assert sent_image(mock_client) == encode_image("test_invoice.png")
+
+    def test_region_work_runs_in_pool(self, image_pool):
+        client = MagicMock()
+        completions = []
+        for content in ('{"regions": [{"x0": 0.5, "y0": 0.6, "x1": 0.95, "y1": 0.75}]}',
+                        '{"invoice_date": "1989-02-06", "total_amount": 2600, "currency": "USD"}'):
+            completion = MagicMock()
+            completion.choices = [MagicMock()]
+            completion.choices[0].message.content = content
+            completions.append(completion)
+        client.chat.completions.create.side_effect = completions
+
+        backend = Backend(type=BackendType.LLAMA, image_pool=image_pool, region_cache=RegionCache())
+        backend.client = client
+        with patch.object(image_pool, "submit", wraps=image_pool.submit) as submit:
+            backend.invoice_properties("test_invoice.png")
+
+        assert [call.args[0] for call in submit.call_args_list] == [dhash, crop_regions]
+        assert sent_image(client) == crop_regions("test_invoice.png", [[0.5, 0.6, 0.95, 0.75]])[0]
+
+    def test_prefetched_region_work_is_reused(self, image_pool):
+        client = MagicMock()
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = '{"invoice_date": "1989-02-06", "total_amount": 2600, "currency": "USD"}'
+        client.chat.completions.create.return_value = completion
+        cache = RegionCache()
+        cache.add(dhash("test_invoice.png"), [[0.5, 0.6, 0.95, 0.75]])
+
+        backend = Backend(type=BackendType.LLAMA, image_pool=image_pool, region_cache=cache)
+        backend.client = client
+        with patch.object(image_pool, "submit", wraps=image_pool.submit) as submit:
+            backend.prefetch_regions("test_invoice.png")
+            backend._prefetched[(dhash, "test_invoice.png")].result()
+            backend.prefetch_regions("test_invoice.png")
+            assert [call.args[0] for call in submit.call_args_list] == [dhash, crop_regions]
+
+            backend.invoice_properties("test_invoice.png")
+            assert submit.call_count == 2
+        assert sent_image(client) == crop_regions("test_invoice.png", [[0.5, 0.6, 0.95, 0.75]])[0]
+        assert not backend._prefetched
+
+    def test_release_drops_unused_prefetch(self, image_pool):
+        backend = Backend(type=BackendType.LLAMA, image_pool=image_pool, region_cache=RegionCache())
+        backend.prefetch_regions("test_invoice.png")
+        backend.release_prefetched("test_invoice.png")
+        assert not backend._prefetched
+
+    def test_prefetch_without_pool_is_noop(self):
+        backend = Backend(type=BackendType.LLAMA, region_cache=RegionCache())
+        backend.prefetch_regions("test_invoice.png")
+        assert backend._prefetched is None
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import threading
+from typing import Iterator
+
+
+class TrafficRecorder:
+    """
+    Append-only JSONL log of /process traffic for replay load testing.
+
+    Each line describes one request: arrival time, image hash and size,
+    per-stage and per-model-call latencies, and the outcome (see api.py).
+
+    Args:
+        path: File to append records to
+        redact: Drop the upload filename and extracted values from records
+
+    Attributes:
+        redact: Whether records are redacted
+    """
+
+    REDACTED_FIELDS = ("filename", "result")
+
+    def __init__(self, path: str, redact: bool = False):
+        self.redact = redact
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, entry: dict) -> None:
+        """
+        Append one request record.
+
+        Args:
+            entry: Request record; redacted fields are removed if `redact` is set
+        """
+        if self.redact:
+            entry = {key: value for key, value in entry.items() if key not in self.REDACTED_FIELDS}
+        line = json.dumps(entry)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the log file."""
+        with self._lock:
+            self._file.close()
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_traffic(path: str) -> Iterator[dict]:
+    """
+    Read recorded requests from a traffic log.
+
+    Args:
+        path: JSONL file written by TrafficRecorder
+
+    Returns:
+        iterator: Request records in file order
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
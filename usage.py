@@ -0,0 +1,126 @@
+import threading
+from typing import Optional
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "total_tokens", "cost")
+
+
+def empty_totals() -> dict:
+    """Return a zeroed usage totals dict."""
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+def _count(value) -> float:
+    """Coerce a usage field to a number, treating missing values as zero."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value
+
+
+class UsageTracker:
+    """
+    Aggregate token and cost usage of LLM calls.
+
+    Totals are kept per image, per backend/model and for the whole run.
+    Thread-safe, so a single tracker can be shared across API requests.
+
+    Args:
+        keep_calls: Also keep each call's usage and latency per image (see pop_calls)
+
+    Attributes:
+        run: Totals over all recorded calls
+        models: Totals keyed by "backend/model"
+    """
+
+    def __init__(self, keep_calls: bool = False):
+        self._lock = threading.Lock()
+        self.keep_calls = keep_calls
+        self.run = empty_totals()
+        self.models = {}
+        self._images = {}
+        self._calls = {}
+
+    def record(self, key: str, image_path: str, usage, latency: Optional[float] = None) -> dict:
+        """
+        Record the usage of a single completion.
+
+        Args:
+            key: Backend/model label the call is attributed to
+            image_path: Image the call was made for
+            usage: The completion's usage object (may be None)
+            latency: Wall-clock duration of the call in seconds (optional)
+
+        Returns:
+            dict: Totals of this call
+        """
+        prompt_tokens = _count(getattr(usage, "prompt_tokens", None))
+        completion_tokens = _count(getattr(usage, "completion_tokens", None))
+        call = {
+            "calls": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": _count(getattr(usage, "total_tokens", None)) or prompt_tokens + completion_tokens,
+            "cost": _count(getattr(usage, "cost", None))
+        }
+
+        with self._lock:
+            for totals in (
+                self.run,
+                self.models.setdefault(key, empty_totals()),
+                self._images.setdefault(image_path, empty_totals())
+            ):
+                for field in USAGE_FIELDS:
+                    totals[field] += call[field]
+            if self.keep_calls:
+                self._calls.setdefault(image_path, []).append({
+                    "model": key,
+                    "latency_ms": None if latency is None else round(latency * 1000, 1),
+                    "total_tokens": call["total_tokens"],
+                    "cost": call["cost"]
+                })
+        return call
+
+    def image(self, image_path: str) -> dict:
+        """Return the totals recorded for an image."""
+        with self._lock:
+            return dict(self._images.get(image_path, empty_totals()))
+
+    def pop_image(self, image_path: str) -> dict:
+        """Return and forget the totals recorded for an image."""
+        with self._lock:
+            return self._images.pop(image_path, empty_totals())
+
+    def pop_calls(self, image_path: str) -> list:
+        """Return and forget the individual calls kept for an image, in call order."""
+        with self._lock:
+            return self._calls.pop(image_path, [])
+
+    def summary(self) -> dict:
+        """
+        Return run and per-model totals.
+
+        Returns:
+            dict: {"run": totals, "models": {"backend/model": totals}}
+        """
+        with self._lock:
+            return {
+                "run": dict(self.run),
+                "models": {key: dict(totals) for key, totals in self.models.items()}
+            }
+
+    def exceeds(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None) -> bool:
+        """
+        Check whether the run totals exceed a token or cost budget.
+
+        Args:
+            max_tokens: Maximum total tokens (optional)
+            max_cost: Maximum cost in credits reported by the backend (optional)
+
+        Returns:
+            bool: True if any configured budget is exceeded
+        """
+        with self._lock:
+            if max_tokens is not None and self.run["total_tokens"] > max_tokens:
+                return True
+            if max_cost is not None and self.run["cost"] > max_cost:
+                return True
+        return False
@@ -32,8 +32,46 @@ INVOICE_PROPERTIES_SCHEMA = {
     "additionalProperties": False
 }
 
+BOUNDING_BOX_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "x0": {"type": "number", "description": "Left edge as a fraction of the page width (0-1)"},
+        "y0": {"type": "number", "description": "Top edge as a fraction of the page height (0-1)"},
+        "x1": {"type": "number", "description": "Right edge as a fraction of the page width (0-1)"},
+        "y1": {"type": "number", "description": "Bottom edge as a fraction of the page height (0-1)"}
+    },
+    "required": ["x0", "y0", "x1", "y1"],
+    "additionalProperties": False
+}
+
+INVOICE_REGIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "regions": {
+            "type": "array",
+            "description": "Bounding boxes of the regions holding the invoice date, total amount and currency",
+            "items": BOUNDING_BOX_SCHEMA
+        }
+    },
+    "required": ["regions"],
+    "additionalProperties": False
+}
+
 INVOICE_DETECTION_PROMPT = "Is this image a photo of an invoice?"
 
+INVOICE_REGIONS_PROMPT = """Locate the regions of this invoice that contain:
+- the invoice date
+- the grand total amount and its currency
+
+Return one bounding box per region as fractions of the page size between 0 and 1,
+with (x0, y0) the top-left and (x1, y1) the bottom-right corner.
+Return an empty list if none of them are visible."""
+
+INVOICE_CROPS_NOTE = """The following images are crops of one invoice showing the regions
+that contain its date and totals, not the full page.
+
+"""
+
 INVOICE_PROPERTIES_PROMPT = """You are an OCR and information-extraction assistant for invoices.
 
 From the provided invoice image, extract the following fields and output ONLY JSON
@@ -69,6 +107,10 @@ def invoice_properties_response_format():
     return INVOICE_PROPERTIES_RESPONSE_FORMAT
 
 
+def invoice_regions_response_format():
+    return INVOICE_REGIONS_RESPONSE_FORMAT
+
+
 INVOICE_DETECTION_RESPONSE_FORMAT = {
     "type": "json_schema",
     "json_schema": {
@@ -91,6 +133,16 @@ INVOICE_PROPERTIES_RESPONSE_FORMAT = {
 }
 
 
+INVOICE_REGIONS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "regions_schema",
+        "strict": True,
+        "schema": INVOICE_REGIONS_SCHEMA
+    }
+}
+
+
 def encode_image(image_path):
     """
     Encode an image file to base64 format.
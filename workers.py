@@ -0,0 +1,42 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv
+from typing import Optional
+
+
+def image_workers(workers: Optional[int] = None) -> int:
+    """
+    Resolve the configured number of image worker processes.
+
+    Args:
+        workers: Explicit worker count (defaults to the IMAGE_WORKERS env var)
+
+    Returns:
+        int: Number of worker processes, 0 meaning inline processing
+    """
+    if workers is None:
+        workers = int(getenv("IMAGE_WORKERS", "0"))
+    return max(workers, 0)
+
+
+def create_image_pool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    Create the process pool for CPU-bound image work.
+
+    Decoding, hashing and cropping run in worker processes so they use all
+    cores instead of the interpreter's one. Work is handed over by file path:
+    each worker decodes the image itself, so only the path goes in and a hash
+    or a few small crops come back. Plain base64 encoding stays inline; it
+    is cheaper than the round trip to a worker.
+
+    Args:
+        workers: Number of worker processes (defaults to the IMAGE_WORKERS env var)
+
+    Returns:
+        ProcessPoolExecutor or None: None if the configured count is 0
+    """
+    workers = image_workers(workers)
+    if not workers:
+        return None
+    # spawn rather than fork: the API and client libraries run threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))